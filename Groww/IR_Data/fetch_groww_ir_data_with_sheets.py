@@ -1,14 +1,23 @@
 import os
+import csv
+import hashlib
 import requests
-import pandas as pd
 import json
-from datetime import datetime, timezone
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import time
 import urllib3
 import gspread
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 
+try:
+    import orjson  # Optional: faster JSON decoding of API responses
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -20,12 +29,44 @@ API_URL = "https://client-pixel.groww.in/api/v1/ir-data/calculate"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_DIR = SCRIPT_DIR
 TIMEOUT = 30
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"  # DD/MM/YYYY HH:MM:SS (GMT)
 PREVIOUS_VALUES_FILE = os.path.join(OUTPUT_DIR, '.previous_metric_values.json')
+LAST_PAYLOAD_HASH_FILE = os.path.join(OUTPUT_DIR, '.last_payload_hash')
+CSV_FIELDS = ['fetch_time', 'metric_type', 'epoch_timestamp', 'value']
+ALL_DATA_SHEET = "All Data"
+ALL_DATA_HEADER = ['Fetch Time', 'Metric Type', 'Epoch Timestamp', 'Value']
+METRIC_SHEET_HEADER = ['Metric Type', 'Epoch Timestamp', 'Value']
+
+# One flattened API value (a tuple, so no per-record dict is allocated)
+MetricRecord = namedtuple('MetricRecord', CSV_FIELDS + ['raw_value'])
+
+# HTTP session shared across fetches (connection pooling + keep-alive)
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+SESSION = requests.Session()
+SESSION.headers.update(DEFAULT_HEADERS)
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET']
+    )
+))
 
 # Google Sheets Configuration
 GOOGLE_SHEET_ID = os.environ.get('GOOGLE_SHEET_ID')
 CREDENTIALS_PATH = os.path.join(SCRIPT_DIR, 'google_sheets_creds.json')
 
+# Spreadsheet handle reused across runs when imported by scheduler.py
+_SPREADSHEET = None
+
+# Worksheet handles by title, loaded once per process from spreadsheet metadata
+_WS_CACHE = {}
+
 # Check if running in GitHub Actions environment
 IN_GITHUB_ACTIONS = os.environ.get('GITHUB_ACTIONS', 'false').lower() == 'true'
 
@@ -47,6 +88,39 @@ def save_previous_metric_values(values_dict):
     except Exception:
         pass
 
+def get_payload_digest(data):
+    """
+    Hash the metric payload so unchanged API responses can be detected cheaply
+    
+    Args:
+        data (dict): Response data from API
+    
+    Returns:
+        str: Hex digest of the (key-sorted) metric data
+    """
+    payload = data.get('data') if isinstance(data, dict) else data
+    if orjson:
+        serialized = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    else:
+        serialized = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(serialized, digest_size=16).hexdigest()
+
+def load_last_payload_digest():
+    """Load the digest of the last saved payload (None if not available)"""
+    try:
+        with open(LAST_PAYLOAD_HASH_FILE, 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def save_last_payload_digest(digest):
+    """Save the digest of the payload that was just saved"""
+    try:
+        with open(LAST_PAYLOAD_HASH_FILE, 'w') as f:
+            f.write(digest)
+    except OSError:
+        pass
+
 def get_metric_value_key(metric_type, epoch_timestamp):
     """Create unique key for tracking metric values"""
     return f"{metric_type}_{epoch_timestamp}"
@@ -81,47 +155,82 @@ def get_google_sheets_client():
             creds = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=scopes)
         
         client = gspread.authorize(creds)
+        # Bound every Sheets request so a stalled call can't hang the scheduler
+        client.set_timeout(TIMEOUT)
         return client
     
     except Exception as e:
         print(f"⚠️  Error connecting to Google Sheets: {e}")
         return None
 
-def epoch_to_formatted_time(epoch_ms):
+def google_sheets_configured():
     """
-    Convert epoch time in milliseconds to DD/MM/YYYY HH:MM:SS GMT format
+    Check whether Google Sheets is set up (sheet ID and credentials present)
     
-    Args:
-        epoch_ms (int): Epoch time in milliseconds
+    Returns:
+        bool: True if a Google Sheets upload should be attempted
+    """
+    if not GOOGLE_SHEET_ID:
+        return False
+    if IN_GITHUB_ACTIONS:
+        return bool(os.environ.get('GOOGLE_SHEETS_CREDENTIALS'))
+    return os.path.exists(CREDENTIALS_PATH)
+
+def open_google_sheet():
+    """
+    Connect to Google Sheets and open the configured spreadsheet
+    
+    The client and spreadsheet are created once per process and reused.
     
     Returns:
-        str: Formatted datetime string in GMT
+        gspread.Spreadsheet: Opened spreadsheet or None if not configured / unreachable
     """
+    global _SPREADSHEET
+    if _SPREADSHEET is not None:
+        return _SPREADSHEET
+    
+    if not GOOGLE_SHEET_ID:
+        return None
+    
+    client = get_google_sheets_client()
+    if client is None:
+        return None
+    
     try:
-        epoch_seconds = epoch_ms / 1000
-        dt = datetime.fromtimestamp(epoch_seconds, tz=timezone.utc)
-        return dt.strftime("%d/%m/%Y %H:%M:%S")
-    except (ValueError, TypeError, OSError):
-        return "N/A"
+        _SPREADSHEET = client.open_by_key(GOOGLE_SHEET_ID)
+        return _SPREADSHEET
+    except gspread.exceptions.APIError as e:
+        print(f"✗ Google Sheets API Error: {e}")
+    except Exception as e:
+        print(f"✗ Error opening Google Sheets: {e}")
+    return None
 
-def convert_to_crores(value, metric_type):
+def convert_values_to_crores(values, metric_type):
     """
-    Convert value to Crores (divide by 10^7) except for CNTU
+    Convert all values of one metric to Crores (divide by 10^7) except for CNTU
+    
+    The CNTU check is done once per metric rather than once per value.
     
     Args:
-        value: Value to convert
-        metric_type (str): Type of metric (CNTU keeps original value)
+        values (list): Values to convert
+        metric_type (str): Type of metric (CNTU keeps original values)
     
     Returns:
-        float: Converted value or original if CNTU
+        list: Converted values (None / non-numeric values are kept as-is)
     """
-    if metric_type == 'CNTU' or value is None:
-        return value
+    if metric_type == 'CNTU':
+        return list(values)
     
-    try:
-        return float(value) / 1e7
-    except (ValueError, TypeError):
-        return value
+    converted = []
+    for value in values:
+        if value is None:
+            converted.append(value)
+            continue
+        try:
+            converted.append(float(value) / 1e7)
+        except (ValueError, TypeError):
+            converted.append(value)
+    return converted
 
 # Create output directory if not exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -132,183 +241,276 @@ def fetch_groww_data(params=None, headers=None):
     
     Args:
         params (dict): Query parameters for the API (optional)
-        headers (dict): Custom headers (optional)
+        headers (dict): Custom headers, merged over the session defaults (optional)
     
     Returns:
         dict: Response data from API
     """
     try:
-        # Default headers
-        if headers is None:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-        
         print(f"Fetching data from {API_URL}...")
-        print(f"Time: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S GMT')}")
+        print(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S GMT', time.gmtime())}")
         
-        # Make request
-        response = requests.get(API_URL, params=params, headers=headers, timeout=TIMEOUT, verify=False)
+        # Make request (reuses pooled connection, retries transient errors)
+        response = SESSION.get(API_URL, params=params, headers=headers, timeout=TIMEOUT, verify=False)
         response.raise_for_status()
         
-        data = response.json()
+        data = orjson.loads(response.content) if orjson else response.json()
         print("✓ Data fetched successfully!")
         
         return data
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"✗ Error fetching data: {e}")
         return None
 
-def save_to_csv(data):
+def flatten(data, fetch_time_gmt):
+    """
+    Flatten the API response into one record per (metric, timestamp) in a single pass
+    
+    Args:
+        data (dict): Response data from API
+        fetch_time_gmt (str): Fetch time stamped on every record
+    
+    Returns:
+        list: MetricRecord tuples (value converted to Crores, raw_value as
+              returned by the API)
+    """
+    rows = []
+    if isinstance(data, dict) and 'data' in data:
+        for metric_type, values in data['data'].items():
+            raw_values = [value_obj.get('value') for value_obj in values]
+            converted_values = convert_values_to_crores(raw_values, metric_type)
+            
+            for value_obj, raw_value, value in zip(values, raw_values, converted_values):
+                rows.append(MetricRecord(
+                    fetch_time_gmt,
+                    metric_type,
+                    value_obj.get('timestamp'),
+                    value,
+                    raw_value
+                ))
+    return rows
+
+def save_to_csv(rows):
     """
-    Save API response to CSV file
+    Append flattened records to the CSV file
     
     Args:
-        data (dict): Data to save
+        rows (list): Records from flatten()
+    
+    Returns:
+        bool: True if the records were written
     """
-    if data is None:
-        print("No data to save to CSV.")
-        return
+    if not rows:
+        print("No records to save to CSV.")
+        return False
     
     filepath = os.path.join(OUTPUT_DIR, "groww_ir_data.csv")
     try:
-        records = []
-        fetch_time_gmt = datetime.now(timezone.utc).strftime("%d/%m/%Y %H:%M:%S")
-        
-        if isinstance(data, dict) and 'data' in data:
-            for metric_type, values in data['data'].items():
-                for value_obj in values:
-                    epoch_timestamp = value_obj.get('timestamp')
-                    record = {
-                        'fetch_time': fetch_time_gmt,
-                        'metric_type': metric_type,
-                        'epoch_timestamp': epoch_timestamp,
-                        'value': convert_to_crores(value_obj.get('value'), metric_type)
-                    }
-                    records.append(record)
-        
-        if records:
-            df = pd.DataFrame(records)
-            file_exists = os.path.exists(filepath)
-            df.to_csv(filepath, mode='a', header=not file_exists, index=False)
-            print(f"✓ CSV: {len(records)} records appended")
-        else:
-            print("No records to save to CSV.")
+        with open(filepath, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            # Append mode opens at end of file: position 0 means a new/empty file
+            if f.tell() == 0:
+                writer.writerow(CSV_FIELDS)
+            writer.writerows(
+                (row.fetch_time, row.metric_type, row.epoch_timestamp, row.value)
+                for row in rows
+            )
+        print(f"✓ CSV: {len(rows)} records appended")
+        return True
     except Exception as e:
         print(f"Error appending CSV: {e}")
+        return False
 
-def save_to_google_sheets(data, client):
+def plan_worksheets(spreadsheet, headers):
     """
-    Save API response to Google Sheets
-    - All Data sheet: Always saves all records (historical)
+    Resolve sheet IDs from the cached worksheet handles, planning any missing sheets
+    
+    Missing sheets get a client-chosen sheetId so their addSheet requests can be
+    sent in the same batchUpdate as the appendCells that fill them. The batch is
+    applied atomically: a sheet is never created without its header row.
+    
+    Args:
+        spreadsheet (gspread.Spreadsheet): Opened spreadsheet
+        headers (dict): Header row per worksheet title
+    
+    Returns:
+        tuple: ({title: sheetId}, list of addSheet requests for missing sheets)
+    """
+    if not _WS_CACHE:
+        # Single metadata request for every sheet instead of one per lookup
+        _WS_CACHE.update({ws.title: ws for ws in spreadsheet.worksheets()})
+    
+    sheet_ids = {title: _WS_CACHE[title].id for title in headers if title in _WS_CACHE}
+    next_id = max((ws.id for ws in _WS_CACHE.values()), default=0) + 1
+    
+    add_requests = []
+    for title in headers:
+        if title in sheet_ids:
+            continue
+        sheet_ids[title] = next_id
+        next_id += 1
+        # Header row only: appendCells grows the grid within the same request,
+        # and unused pre-allocated rows count against the workbook's cell limit
+        add_requests.append({
+            'addSheet': {
+                'properties': {
+                    'sheetId': sheet_ids[title],
+                    'title': title,
+                    'sheetType': 'GRID',
+                    'gridProperties': {'rowCount': 1, 'columnCount': len(headers[title])}
+                }
+            }
+        })
+    
+    return sheet_ids, add_requests
+
+def cache_added_worksheets(spreadsheet, response):
+    """
+    Cache handles for the sheets created by a batchUpdate
+    
+    Args:
+        spreadsheet (gspread.Spreadsheet): Opened spreadsheet
+        response (dict): batchUpdate response
+    """
+    for reply in response.get('replies', []):
+        if 'addSheet' in reply:
+            properties = reply['addSheet']['properties']
+            _WS_CACHE[properties['title']] = gspread.Worksheet(
+                spreadsheet, properties, spreadsheet.id, spreadsheet.client
+            )
+
+def to_row_data(values):
+    """
+    Convert a row of Python values into Sheets API RowData (raw, unparsed)
+    
+    Args:
+        values (list): Cell values for one row
+    
+    Returns:
+        dict: RowData for an appendCells request
+    """
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append({})
+        elif isinstance(value, bool):
+            cells.append({'userEnteredValue': {'boolValue': value}})
+        elif isinstance(value, (int, float)):
+            cells.append({'userEnteredValue': {'numberValue': value}})
+        else:
+            cells.append({'userEnteredValue': {'stringValue': str(value)}})
+    return {'values': cells}
+
+def append_cells_request(sheet_id, rows):
+    """
+    Build an appendCells request that adds rows after the last row with data
+    
+    Args:
+        sheet_id (int): Target sheet ID
+        rows (list): Rows (lists of values) to append
+    
+    Returns:
+        dict: Request for spreadsheet.batch_update
+    """
+    return {
+        'appendCells': {
+            'sheetId': sheet_id,
+            'rows': [to_row_data(row) for row in rows],
+            'fields': 'userEnteredValue'
+        }
+    }
+
+def save_to_google_sheets(rows, spreadsheet):
+    """
+    Save flattened records to Google Sheets
+    - All Data sheet: Saves all records of every run whose payload changed
+      (main() skips runs with an unchanged payload)
     - Metric sheets: Only saves when values change (deduplication)
     
     Args:
-        data (dict): Data to save
-        client: gspread client
+        rows (list): Records from flatten()
+        spreadsheet: Opened gspread spreadsheet (see open_google_sheet)
+    
+    Returns:
+        bool: True if the records were written
     """
-    if data is None:
-        return
+    if not rows:
+        return False
     
     # Load previous values for change detection (always, even without client)
     previous_values = load_previous_metric_values()
     current_values = {}
-    metric_records = {}
+    metric_records = defaultdict(list)
     
-    # Prepare metric data for deduplication
-    if isinstance(data, dict) and 'data' in data:
-        for metric_type, values in data['data'].items():
-            metric_records[metric_type] = []
-            
-            for value_obj in values:
-                epoch_timestamp = value_obj.get('timestamp')
-                raw_value = value_obj.get('value')
-                converted_value = convert_to_crores(raw_value, metric_type)
-                
-                # Create key for tracking
-                value_key = get_metric_value_key(metric_type, epoch_timestamp)
-                current_values[value_key] = raw_value
-                
-                # Metric sheet: Only collect if value changed
-                previous_value = previous_values.get(value_key)
-                if previous_value is None or previous_value != raw_value:
-                    metric_record = [
-                        metric_type,
-                        epoch_timestamp,
-                        converted_value
-                    ]
-                    metric_records[metric_type].append(metric_record)
+    for row in rows:
+        metric_type = row.metric_type
+        raw_value = row.raw_value
+        
+        # Create key for tracking
+        value_key = get_metric_value_key(metric_type, row.epoch_timestamp)
+        current_values[value_key] = raw_value
+        
+        # Metric sheet: Only collect if value changed
+        previous_value = previous_values.get(value_key)
+        if previous_value is None or previous_value != raw_value:
+            metric_records[metric_type].append([
+                metric_type,
+                row.epoch_timestamp,
+                row.value
+            ])
     
     # Save tracking file (always, for next comparison)
     save_previous_metric_values(current_values)
     
-    # If no client, we can't save to Google Sheets
-    if client is None:
-        return
+    # If no spreadsheet, we can't save to Google Sheets
+    if spreadsheet is None:
+        return False
     
     try:
-        # Open the spreadsheet
-        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
-        
-        # Prepare data
-        fetch_time_gmt = datetime.now(timezone.utc).strftime("%d/%m/%Y %H:%M:%S")
-        all_records = []
+        # All Data sheet: Always append (historical record)
+        all_records = [
+            [row.fetch_time, row.metric_type, row.epoch_timestamp, row.value]
+            for row in rows
+        ]
         
-        if isinstance(data, dict) and 'data' in data:
-            for metric_type, values in data['data'].items():
-                for value_obj in values:
-                    epoch_timestamp = value_obj.get('timestamp')
-                    converted_value = convert_to_crores(value_obj.get('value'), metric_type)
-                    
-                    # All Data sheet: Always append (historical record)
-                    all_data_record = [
-                        fetch_time_gmt,
-                        metric_type,
-                        epoch_timestamp,
-                        converted_value
-                    ]
-                    all_records.append(all_data_record)
+        # Sheets to write: "All Data" (always) + metric sheets with changed values
+        headers = {ALL_DATA_SHEET: ALL_DATA_HEADER}
+        headers.update({f"{metric_type}_Data": METRIC_SHEET_HEADER for metric_type in metric_records})
+        sheet_ids, add_requests = plan_worksheets(spreadsheet, headers)
+        created = {request['addSheet']['properties']['title'] for request in add_requests}
         
-        # Update "All Data" sheet (always)
-        try:
-            all_data_sheet = spreadsheet.worksheet("All Data")
-        except gspread.exceptions.WorksheetNotFound:
-            all_data_sheet = spreadsheet.add_worksheet(title="All Data", rows=1000, cols=4)
-            all_data_sheet.append_row([
-                'Fetch Time', 'Metric Type', 'Epoch Timestamp', 'Value'
-            ])
+        # New sheets, their header rows and all data go in a single (atomic) batchUpdate
+        def append_request(title, records):
+            if title in created:
+                records = [headers[title]] + records
+            return append_cells_request(sheet_ids[title], records)
         
-        if all_records:
-            all_data_sheet.append_rows(all_records)
-            print(f"✓ Google Sheets (All Data): {len(all_records)} records appended")
+        append_requests = [append_request(ALL_DATA_SHEET, all_records)]
         
         # Update metric-specific sheets (only changed values)
         changed_count = 0
         for metric_type, records in metric_records.items():
-            if records:  # Only update if there are changed values
-                sheet_name = f"{metric_type}_Data"
-                
-                try:
-                    metric_sheet = spreadsheet.worksheet(sheet_name)
-                except gspread.exceptions.WorksheetNotFound:
-                    metric_sheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=3)
-                    metric_sheet.append_row([
-                        'Metric Type', 'Epoch Timestamp', 'Value'
-                    ])
-                
-                metric_sheet.append_rows(records)
-                changed_count += len(records)
+            append_requests.append(append_request(f"{metric_type}_Data", records))
+            changed_count += len(records)
         
+        response = spreadsheet.batch_update({'requests': add_requests + append_requests})
+        cache_added_worksheets(spreadsheet, response)
+        
+        print(f"✓ Google Sheets (All Data): {len(all_records)} records appended")
         if changed_count > 0:
             print(f"✓ Google Sheets: {changed_count} changed metric values saved")
         else:
             print("✓ Google Sheets: No metric values changed (deduplication)")
+        return True
     
     except gspread.exceptions.APIError as e:
+        # Sheets may have been renamed/deleted; reload metadata on the next run
+        _WS_CACHE.clear()
         print(f"✗ Google Sheets API Error: {e}")
     except Exception as e:
         print(f"✗ Error updating Google Sheets: {e}")
+    return False
 
 def main():
     """Main execution function"""
@@ -322,20 +524,46 @@ def main():
     else:
         print("✓ Running locally")
     
-    # Fetch data
-    data = fetch_groww_data(params=None)
-    
-    if data:
-        # Save to CSV
-        save_to_csv(data)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Connect to Google Sheets while the API request is in flight
+        spreadsheet_future = executor.submit(open_google_sheet)
         
+        # Fetch data
+        data = fetch_groww_data(params=None)
+        
+        rows = []
+        csv_saved = False
+        if data:
+            # Skip both sinks when the API returned exactly the same values
+            payload_digest = get_payload_digest(data)
+            if payload_digest == load_last_payload_digest():
+                print("✓ Data unchanged since last run, skipping CSV and Google Sheets")
+            else:
+                # Flatten once; CSV and Google Sheets consume the same records
+                fetch_time_gmt = time.strftime(TIME_FORMAT, time.gmtime())
+                rows = flatten(data, fetch_time_gmt)
+                
+                # Save to CSV
+                csv_saved = save_to_csv(rows)
+        
+        spreadsheet = spreadsheet_future.result()
+    
+    if rows:
         # Save to Google Sheets
-        sheets_client = get_google_sheets_client()
-        if sheets_client and GOOGLE_SHEET_ID:
-            save_to_google_sheets(data, sheets_client)
-        elif not IN_GITHUB_ACTIONS:
-            print("⚠️  Google Sheets not configured")
+        if spreadsheet is not None:
+            sheets_saved = save_to_google_sheets(rows, spreadsheet)
+        else:
+            # Not configured counts as done; configured but unreachable does not
+            sheets_saved = not google_sheets_configured()
+            if sheets_saved and not IN_GITHUB_ACTIONS:
+                print("⚠️  Google Sheets not configured")
         
+        # Only mark this payload as saved once every configured sink has it,
+        # so a failed run is retried even if the next payload is identical
+        if csv_saved and sheets_saved:
+            save_last_payload_digest(payload_digest)
+    
+    if data:
         # Print data summary
         print("\n📊 Data summary:")
         if isinstance(data, dict):